@@ -1,13 +1,26 @@
 import asyncio
+import ctypes
 import os
+import pickle
+import struct
+import sys
 import yaml
-import glob
+try:
+    # libyaml C 加速器，解析速度远快于纯 Python 的 SafeLoader
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
+import fnmatch
 import re
 import aiofiles
+import orjson
+from copy import deepcopy
 from typing import List, Dict, Optional, AsyncGenerator
 from pathlib import Path
+from sortedcontainers import SortedDict
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from backend.security import validate_path_cached
 from backend.ssh_manager import SSHConnectionPool, RemoteFileReader
 
 CONFIG_PATH = "config/settings.yaml"
@@ -15,11 +28,84 @@ CONFIG_PATH = "config/settings.yaml"
 # ANSI 颜色代码的正则表达式（支持带和不带 ESC 前缀的格式）
 ANSI_ESCAPE_PATTERN = re.compile(r'(\x1B\[[0-?]*[ -/]*[@-~]|\[[0-9;]+m)')
 
+def format_sse_event(text) -> bytes:
+    """把一段文本（str 或 bytes）编码为 SSE data 事件（多行内容逐行加 data: 前缀）"""
+    if isinstance(text, str):
+        text = text.encode()
+    if b'\n' in text:
+        return b''.join(b'data: ' + line + b'\n' for line in text.split(b'\n')) + b'\n'
+    return b'data: ' + text + b'\n\n'
+
+
 def strip_ansi_codes(text: str) -> str:
     """移除 ANSI 颜色代码"""
+    # 大部分日志行根本没有颜色代码，先用 C 级别的 in 判断跳过正则
+    if '\x1b' not in text and '[' not in text:
+        return text
     return ANSI_ESCAPE_PATTERN.sub('', text)
 
 
+# Linux 上优先使用 inotify（无需 watchdog 线程），其他平台退回 watchdog
+if sys.platform == 'linux':
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.inotify_init1
+        _INOTIFY_AVAILABLE = True
+    except (OSError, AttributeError):
+        _INOTIFY_AVAILABLE = False
+else:
+    _INOTIFY_AVAILABLE = False
+
+
+class InotifyWatcher:
+    """基于 inotify 的单文件监听（仅 Linux）
+
+    把 inotify fd 直接注册到事件循环，修改事件在主循环内设置标志，
+    省掉 watchdog 的 Observer 线程和每个事件一次的 call_soon_threadsafe。
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+
+    def __init__(self, file_path: str, event_flag: asyncio.Event, loop):
+        self.file_name = os.path.basename(file_path).encode()
+        self.event_flag = event_flag
+        self.loop = loop
+
+        self.fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # 监听所在目录并按文件名过滤，这样文件被轮转重建后仍能收到事件
+        watch_dir = os.path.dirname(file_path) or "."
+        mask = self.IN_MODIFY | self.IN_MOVED_TO | self.IN_CREATE
+        if _libc.inotify_add_watch(self.fd, watch_dir.encode(), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, "inotify_add_watch failed")
+
+        loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except OSError:
+            return
+        # struct inotify_event: int wd; uint32 mask, cookie, len; char name[]
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, cookie, name_len = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + name_len].rstrip(b'\0')
+            offset += 16 + name_len
+            if name == self.file_name:
+                self.event_flag.set()
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
 class FileWatcher(FileSystemEventHandler):
     """文件监控处理器（线程安全）"""
     
@@ -48,11 +134,56 @@ class LogManager:
         self.ssh_pool = SSHConnectionPool(max_connections=10, timeout=300)
         self.remote_reader = RemoteFileReader(self.ssh_pool)
 
+        # 本地文件列表缓存（按配置文件与各扫描目录的 mtime 失效）
+        self._file_list_cache: Optional[List[Dict]] = None
+        self._file_list_key = None
+
+        # 序列化结果缓存（仅无远程服务器时可复用）
+        self._file_list_bytes: Optional[bytes] = None
+        self._file_list_bytes_key = None
+
+        # 事件循环在首个流式请求时捕获一次，后续连接直接复用
+        self._loop = None
+
+        # 远程目录型日志的前缀索引："服务器名/日志名/" -> (服务器配置, 日志配置)
+        self._remote_dir_index = {}
+        for server_config in self.config.get("remote_servers", []):
+            server_name = server_config.get("name", "Remote")
+            for log_config in server_config.get("logs", []):
+                if log_config.get("type", "file") == "directory":
+                    prefix = f"{server_name}/{log_config.get('name')}/"
+                    self._remote_dir_index[prefix] = (server_config, log_config)
+
     def _load_config(self) -> dict:
-        if not os.path.exists(CONFIG_PATH):
+        try:
+            st = os.stat(CONFIG_PATH)
+        except OSError:
             return {"log_files": [], "log_directories": []}
+
+        # 优先读取 mtime 匹配的 pickle 缓存，跳过 YAML 解析
+        cache_path = CONFIG_PATH + ".cache"
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_mtime, = struct.unpack('<q', f.read(8))
+                if cached_mtime == st.st_mtime_ns:
+                    return pickle.load(f)
+        except (OSError, struct.error, pickle.UnpicklingError, EOFError):
+            pass
+
         with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+            config = yaml.load(f, Loader=YamlSafeLoader)
+
+        # 写回缓存（先写临时文件再原子替换，避免读到半截数据）
+        try:
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(struct.pack('<q', st.st_mtime_ns))
+                f.write(pickle.dumps(config, protocol=pickle.HIGHEST_PROTOCOL))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+
+        return config
 
     def _scan_directory(self, dir_config: dict) -> List[Dict]:
         """扫描目录，返回所有日志文件"""
@@ -63,25 +194,46 @@ class LogManager:
         
         if not scan_dir or not os.path.exists(scan_dir):
             return []
-        
+
+        # 模式只编译一次，目录项通过 scandir 遍历（d_type 缓存，省掉逐项 stat）
+        pat = re.compile(fnmatch.translate(pattern))
+        prefix_len = len(scan_dir.rstrip(os.sep)) + 1
+
+        def _walk(root: str):
+            try:
+                entries = os.scandir(root)
+            except OSError:
+                return
+            with entries:
+                for entry in entries:
+                    try:
+                        # 与 glob 行为保持一致：跳过隐藏文件，也不进隐藏目录
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                yield from _walk(entry.path)
+                        elif entry.is_file(follow_symlinks=False) and pat.match(entry.name):
+                            yield entry
+                    except OSError:
+                        continue
+
         files = []
-        search_pattern = os.path.join(scan_dir, "**", pattern) if recursive else os.path.join(scan_dir, pattern)
-        
-        for file_path in glob.glob(search_pattern, recursive=recursive):
-            if os.path.isfile(file_path):
-                # 生成相对于扫描目录的显示名称
-                rel_path = os.path.relpath(file_path, scan_dir)
-                files.append({
-                    "name": rel_path,
-                    "path": file_path,
-                    "encoding": encoding,
-                })
-        
+        for entry in _walk(scan_dir):
+            # 生成相对于扫描目录的显示名称，并复用 scandir 的 stat 结果
+            files.append({
+                "name": entry.path[prefix_len:],
+                "path": entry.path,
+                "encoding": encoding,
+                "size": entry.stat().st_size,
+            })
+
         return files
 
     def _build_tree_structure(self, files: List[Dict], base_name: str) -> List[Dict]:
         """将扁平的文件列表转换为树状结构"""
-        tree = {}
+        # SortedDict 在插入时维持兄弟节点有序，转换阶段无需再逐层 sorted
+        tree = SortedDict()
         
         for file_info in files:
             rel_path = file_info["name"]
@@ -92,13 +244,14 @@ class LogManager:
                 if part not in current_level:
                     is_file = (i == len(path_parts) - 1)
                     if is_file:
-                        # 叶子节点（文件）
+                        # 叶子节点（文件），直接带上扫描阶段的 stat 结果
                         unique_name = f"{base_name}/{rel_path}"
                         current_level[part] = {
                             "name": unique_name,
                             "label": part,  # 只显示文件名
                             "path": file_info["path"],
                             "encoding": file_info["encoding"],
+                            "size": file_info.get("size", 0),
                             "type": "file",
                             "is_leaf": True
                         }
@@ -108,35 +261,39 @@ class LogManager:
                             "name": part,
                             "label": part,  # 只显示目录名
                             "type": "directory",
-                            "children": {}
+                            "children": SortedDict()
                         }
                 
                 if not current_level[part].get("is_leaf"):
                     current_level = current_level[part]["children"]
         
-        # 将字典转换为列表格式
-        def dict_to_list(node_dict):
-            result = []
-            for key, value in sorted(node_dict.items()):
+        # 将字典转换为列表格式（显式栈代替递归，避免深目录的递归开销）
+        result = []
+        stack = [(tree, result)]
+        while stack:
+            node_dict, out = stack.pop()
+            for key, value in node_dict.items():
                 if value.get("type") == "directory":
-                    result.append({
+                    children = []
+                    out.append({
                         "name": value["name"],
                         "label": value["label"],
                         "type": "directory",
-                        "children": dict_to_list(value["children"])
+                        "children": children
                     })
+                    stack.append((value["children"], children))
                 else:
-                    result.append({
+                    # 扫描阶段刚 stat 过，复用 size，不再重复两次 stat
+                    out.append({
                         "name": value["name"],
                         "label": value["label"],
                         "path": value["path"],
-                        "exists": os.path.exists(value["path"]),
-                        "size": os.path.getsize(value["path"]) if os.path.exists(value["path"]) else 0,
+                        "exists": True,
+                        "size": value["size"],
                         "type": "file"
                     })
-            return result
-        
-        return dict_to_list(tree)
+
+        return result
 
     def _build_files_map(self) -> Dict[str, dict]:
         """构建文件名到配置的映射"""
@@ -224,7 +381,7 @@ class LogManager:
     def _build_remote_dir_tree(self, files: List[Dict], base_path: str, 
                                server_name: str, dir_name: str) -> List[Dict]:
         """构建远程目录的树状结构"""
-        tree = {}
+        tree = SortedDict()
         
         for file_info in files:
             file_path = file_info["path"]
@@ -253,25 +410,29 @@ class LogManager:
                             "name": part,
                             "label": part,
                             "type": "directory",
-                            "children": {}
+                            "children": SortedDict()
                         }
                 
                 if not current_level[part].get("is_leaf"):
                     current_level = current_level[part]["children"]
         
-        # 转换为列表
-        def dict_to_list(node_dict):
-            result = []
-            for key, value in sorted(node_dict.items()):
+        # 转换为列表（与 _build_tree_structure 相同的显式栈写法）
+        result = []
+        stack = [(tree, result)]
+        while stack:
+            node_dict, out = stack.pop()
+            for key, value in node_dict.items():
                 if value.get("type") == "directory":
-                    result.append({
+                    children = []
+                    out.append({
                         "name": value["name"],
                         "label": value["label"],
                         "type": "directory",
-                        "children": dict_to_list(value["children"])
+                        "children": children
                     })
+                    stack.append((value["children"], children))
                 else:
-                    result.append({
+                    out.append({
                         "name": value["name"],
                         "label": value["label"],
                         "path": value["path"],
@@ -279,24 +440,47 @@ class LogManager:
                         "source": "remote",
                         "exists": True
                     })
-            return result
-        
-        return dict_to_list(tree)
+
+        return result
+
+    def _file_list_cache_key(self) -> tuple:
+        """计算文件列表缓存键：配置文件与各扫描目录的 mtime"""
+        try:
+            key = [os.stat(CONFIG_PATH).st_mtime_ns]
+        except OSError:
+            key = [0]
+        for dir_config in self.config.get("log_directories", []):
+            scan_dir = dir_config.get("scan_dir")
+            try:
+                key.append((scan_dir, os.stat(scan_dir).st_mtime_ns))
+            except (OSError, TypeError):
+                key.append((scan_dir, 0))
+        return tuple(key)
 
     def get_file_list(self) -> List[Dict]:
         """获取可用的文件列表，检查文件是否存在（同步版本，用于初始化）"""
+        # 配置和扫描目录都没变时直接命中缓存，省掉整个目录遍历
+        key = self._file_list_cache_key()
+        if key == self._file_list_key and self._file_list_cache is not None:
+            return deepcopy(self._file_list_cache)
+
         result = []
         
-        # 手动配置的本地文件
+        # 手动配置的本地文件（一次 stat 同时拿存在性和大小）
         for file_conf in self.config.get("log_files", []):
             path = file_conf.get("path")
-            exists = os.path.exists(path) if path else False
+            try:
+                size = os.stat(path).st_size
+                exists = True
+            except (OSError, TypeError):
+                size = 0
+                exists = False
             result.append({
                 "name": file_conf["name"],
                 "label": file_conf["name"],
                 "path": path,
                 "exists": exists,
-                "size": os.path.getsize(path) if exists else 0,
+                "size": size,
                 "type": "file",
                 "source": "local"
             })
@@ -316,9 +500,13 @@ class LogManager:
                     "children": tree_nodes
                 }
                 result.append(group_node)
-        
+
+        # 缓存深拷贝：调用方（如 get_file_list_async 追加远程分组）
+        # 改动返回值时不能污染缓存
+        self._file_list_cache = deepcopy(result)
+        self._file_list_key = key
         return result
-    
+
     async def get_file_list_async(self) -> List[Dict]:
         """获取完整文件列表（包括远程服务器），异步版本"""
         result = self.get_file_list()  # 先获取本地文件
@@ -355,6 +543,20 @@ class LogManager:
         
         return result
 
+    async def get_file_list_bytes(self) -> bytes:
+        """获取文件列表的 JSON 字节（orjson 序列化，无远程服务器时直接复用）"""
+        if self.config.get("remote_servers"):
+            return orjson.dumps(await self.get_file_list_async())
+
+        # 纯本地配置：序列化结果与文件列表一起按 mtime 键缓存
+        key = self._file_list_cache_key()
+        if key == self._file_list_bytes_key and self._file_list_bytes is not None:
+            return self._file_list_bytes
+
+        self._file_list_bytes = orjson.dumps(self.get_file_list())
+        self._file_list_bytes_key = key
+        return self._file_list_bytes
+
     def clear_log(self, file_name: str) -> bool:
         """清空日志文件（本地或远程）"""
         file_conf = self.files_map.get(file_name)
@@ -404,10 +606,10 @@ class LogManager:
                 return await self.remote_reader.clear_file(server_config, file_path)
             return False
 
-    async def tail_file(self, file_name: str, request_args: dict) -> AsyncGenerator[Dict[str, str], None]:
+    async def tail_file(self, file_name: str, request_args: dict) -> AsyncGenerator[bytes, None]:
         """
         生成器：实时读取日志文件（本地或远程）
-        yields: 格式化的 SSE 数据块
+        yields: 编码好的 SSE 字节块
         """
         file_conf = self.files_map.get(file_name)
         
@@ -416,7 +618,7 @@ class LogManager:
             file_conf = await self._resolve_remote_file(file_name)
         
         if not file_conf:
-            yield {"data": "[SYSTEM] File not found or configured incorrectly."}
+            yield format_sse_event("[SYSTEM] File not found or configured incorrectly.")
             return
         
         source = file_conf.get("source", "local")
@@ -428,18 +630,27 @@ class LogManager:
             encoding = file_conf.get("encoding", "utf-8")
             
             if not server_config or not file_path:
-                yield {"data": "[SYSTEM] Remote file configuration error."}
+                yield format_sse_event("[SYSTEM] Remote file configuration error.")
+                return
+
+            # 回环地址的"远程"文件直接走下面的本地管线，跳过 SSH 栈；
+            # 白名单校验保持和远程读取器一致
+            host = server_config.get("host")
+            if host in ("127.0.0.1", "localhost", "::1") and os.path.exists(file_path):
+                allowed = tuple(server_config.get("allowed_paths", []))
+                if not validate_path_cached(file_path, allowed):
+                    yield format_sse_event(f"[SECURITY] Access denied: {file_path}")
+                    return
+            else:
+                # 使用远程读取器
+                async for log_data in self.remote_reader.tail_file(server_config, file_path, encoding):
+                    yield format_sse_event(log_data["data"])
                 return
-            
-            # 使用远程读取器
-            async for log_data in self.remote_reader.tail_file(server_config, file_path, encoding):
-                yield log_data
-            return
         
         # 本地文件处理（异步 + 文件监控）
         file_path = file_conf.get("path")
         if not os.path.exists(file_path):
-            yield {"data": "[SYSTEM] File not found or configured incorrectly."}
+            yield format_sse_event("[SYSTEM] File not found or configured incorrectly.")
             return
 
         encoding = file_conf.get("encoding", "utf-8")
@@ -448,118 +659,182 @@ class LogManager:
         file_modified = asyncio.Event()
         
         try:
-            # 初始读取历史日志（异步）
-            async with aiofiles.open(file_path, 'r', encoding=encoding, errors='replace') as fp:
-                # 获取文件大小
-                file_size = os.path.getsize(file_path)
-                if file_size > 0:
-                    # 读取最后 10KB
-                    read_size = min(file_size, 1024 * 10)
-                    await fp.seek(file_size - read_size)
-                    
-                    # 丢弃第一行可能不完整的数据
-                    if read_size < file_size:
-                        await fp.readline()
-                    
-                    # 读取并发送现有内容
-                    async for line in fp:
-                        if line.strip():
-                            clean_line = strip_ansi_codes(line.strip())
-                            yield {"data": clean_line}
-            
+            # 初始读取历史日志（尾部窗口很小，一次同步 pread 比走线程池更快）
+            file_size = os.path.getsize(file_path)
+            if file_size > 0:
+                # 读取最后 10KB
+                read_size = min(file_size, 1024 * 10)
+                fd = os.open(file_path, os.O_RDONLY)
+                try:
+                    buf = os.pread(fd, read_size, file_size - read_size)
+                finally:
+                    os.close(fd)
+
+                lines = buf.decode(encoding, errors='replace').split('\n')
+
+                # 丢弃第一行可能不完整的数据
+                if read_size < file_size:
+                    lines = lines[1:]
+
+                # 发送现有内容（多行合并为一个 SSE 事件，减少逐行推送开销）
+                batch = []
+                batch_size = 0
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    line = strip_ansi_codes(line)
+                    batch.append(line)
+                    batch_size += len(line)
+                    if len(batch) >= 32 or batch_size >= 8192:
+                        yield format_sse_event("\n".join(batch))
+                        batch.clear()
+                        batch_size = 0
+                if batch:
+                    yield format_sse_event("\n".join(batch))
+
             # 获取当前文件位置（用于后续读取）
             current_position = os.path.getsize(file_path)
             
-            # 启动文件监控（线程安全）
-            observer = Observer()
-            watch_dir = os.path.dirname(file_path)
-            loop = asyncio.get_event_loop()
-            
-            event_handler = FileWatcher(file_path, file_modified, loop)
-            observer.schedule(event_handler, watch_dir, recursive=False)
-            observer.start()
+            # 启动文件监控：Linux 直接走 inotify，其余平台用 watchdog 线程
+            if self._loop is None:
+                self._loop = asyncio.get_running_loop()
+            loop = self._loop
+            watcher = None
+            observer = None
+
+            if _INOTIFY_AVAILABLE:
+                try:
+                    watcher = InotifyWatcher(file_path, file_modified, loop)
+                except OSError:
+                    watcher = None
+
+            if watcher is None:
+                observer = Observer()
+                watch_dir = os.path.dirname(file_path)
+                event_handler = FileWatcher(file_path, file_modified, loop)
+                observer.schedule(event_handler, watch_dir, recursive=False)
+                observer.start()
             
             try:
-                # 实时读取循环
-                while True:
-                    # 等待文件修改事件（带超时）
-                    try:
-                        await asyncio.wait_for(file_modified.wait(), timeout=2.0)
-                        file_modified.clear()
-                    except asyncio.TimeoutError:
-                        # 超时，检查文件是否仍然存在
-                        if not os.path.exists(file_path):
-                            yield {"data": "[SYSTEM] File disappeared."}
-                            break
-                        continue
-                    
-                    # 文件被修改，读取新内容
-                    try:
-                        new_size = os.path.getsize(file_path)
-                        
-                        # 检查文件是否被截断
-                        if new_size < current_position:
-                            yield {"data": "[SYSTEM] File truncated. Reloading..."}
-                            current_position = 0
-                        
-                        # 读取新行
-                        async with aiofiles.open(file_path, 'r', encoding=encoding, errors='replace') as fp:
+                # 文件跨迭代保持打开（二进制模式，整段读出后一次性解码），
+                # 只在截断/轮转时重新打开
+                fp = await aiofiles.open(file_path, 'rb')
+                try:
+                    # 高频写入的文件改用轮询：每次事件的唤醒开销比 100ms 一次
+                    # 的 stat 更贵。连续 3 次快速唤醒后切换
+                    polling = False
+                    fast_wakeups = 0
+
+                    # 实时读取循环
+                    while True:
+                        if polling:
+                            await asyncio.sleep(0.1)
+                            try:
+                                if os.path.getsize(file_path) == current_position:
+                                    continue
+                            except OSError:
+                                yield format_sse_event("[SYSTEM] File disappeared.")
+                                break
+                        else:
+                            # 等待文件修改事件（带超时）
+                            try:
+                                wait_start = loop.time()
+                                await asyncio.wait_for(file_modified.wait(), timeout=2.0)
+                                file_modified.clear()
+                                # 短暂等待以合并紧随其后的修改事件，减少 seek/read 次数
+                                await asyncio.sleep(0.05)
+                                file_modified.clear()
+
+                                if loop.time() - wait_start < 0.1:
+                                    fast_wakeups += 1
+                                    if fast_wakeups >= 3:
+                                        polling = True
+                                        if watcher is not None:
+                                            watcher.close()
+                                            watcher = None
+                                        elif observer is not None:
+                                            observer.stop()
+                                            observer.join(timeout=1)
+                                            observer = None
+                                else:
+                                    fast_wakeups = 0
+                            except asyncio.TimeoutError:
+                                # 超时，检查文件是否仍然存在
+                                if not os.path.exists(file_path):
+                                    yield format_sse_event("[SYSTEM] File disappeared.")
+                                    break
+                                continue
+
+                        # 文件被修改，读取新内容
+                        try:
+                            new_size = os.path.getsize(file_path)
+
+                            # 检查文件是否被截断
+                            if new_size < current_position:
+                                yield format_sse_event("[SYSTEM] File truncated. Reloading...")
+                                current_position = 0
+                                # 文件可能被轮转，重新打开以拿到新的 inode
+                                await fp.close()
+                                fp = await aiofiles.open(file_path, 'rb')
+
+                            # 整段读出新增内容，一次解码后按行拆分（按批合并推送）
                             await fp.seek(current_position)
-                            async for line in fp:
-                                if line.strip():
-                                    clean_line = strip_ansi_codes(line.strip())
-                                    yield {"data": clean_line}
+                            raw = await fp.read()
                             current_position = await fp.tell()
-                    
-                    except OSError as e:
-                        # 文件可能正在被轮转
-                        await asyncio.sleep(0.1)
-                        continue
-            
+
+                            batch = []
+                            batch_size = 0
+                            for line in raw.decode(encoding, errors='replace').split('\n'):
+                                line = line.strip()
+                                if not line:
+                                    continue
+                                line = strip_ansi_codes(line)
+                                batch.append(line)
+                                batch_size += len(line)
+                                if len(batch) >= 32 or batch_size >= 8192:
+                                    yield format_sse_event("\n".join(batch))
+                                    batch.clear()
+                                    batch_size = 0
+                            if batch:
+                                yield format_sse_event("\n".join(batch))
+
+                        except OSError as e:
+                            # 文件可能正在被轮转
+                            await asyncio.sleep(0.1)
+                            continue
+                finally:
+                    await fp.close()
+
             finally:
-                observer.stop()
-                observer.join(timeout=1)
+                if watcher is not None:
+                    watcher.close()
+                if observer is not None:
+                    observer.stop()
+                    observer.join(timeout=1)
         
         except Exception as e:
-            yield {"data": f"[SYSTEM] Error reading file: {str(e)}"}
+            yield format_sse_event(f"[SYSTEM] Error reading file: {str(e)}")
     
     async def _resolve_remote_file(self, file_name: str) -> Optional[Dict]:
         """
         解析远程文件路径（用于动态扫描的目录文件）
         file_name 格式: "服务器名/目录名/相对路径"
         """
-        # 尝试匹配远程服务器配置
-        for server_config in self.config.get("remote_servers", []):
-            server_name = server_config.get("name", "Remote")
-            
-            # 检查 file_name 是否以服务器名开头
-            if not file_name.startswith(f"{server_name}/"):
-                continue
-            
-            # 移除服务器名前缀
-            remaining_path = file_name[len(server_name) + 1:]
-            
-            # 遍历该服务器的日志配置
-            for log_config in server_config.get("logs", []):
-                log_name = log_config.get("name")
-                log_type = log_config.get("type", "file")
-                
-                # 如果是目录类型，尝试匹配
-                if log_type == "directory" and remaining_path.startswith(f"{log_name}/"):
-                    # 提取相对路径
-                    rel_path = remaining_path[len(log_name) + 1:]
-                    base_path = log_config.get("path")
-                    
-                    # 构建完整路径
-                    full_path = os.path.join(base_path, rel_path)
-                    
-                    return {
-                        "path": full_path,
-                        "encoding": "utf-8",
-                        "source": "remote",
-                        "server_config": server_config
-                    }
-        
+        # 目录型日志在构造时已建好前缀索引，这里只扫这个小集合
+        for prefix, (server_config, log_config) in self._remote_dir_index.items():
+            if file_name.startswith(prefix):
+                # 提取相对路径并构建完整路径
+                rel_path = file_name[len(prefix):]
+                full_path = os.path.join(log_config.get("path"), rel_path)
+
+                return {
+                    "path": full_path,
+                    "encoding": "utf-8",
+                    "source": "remote",
+                    "server_config": server_config
+                }
+
         return None
     
     async def cleanup(self):
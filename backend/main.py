@@ -1,15 +1,40 @@
-from fastapi import FastAPI, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.gzip import GZipMiddleware
-from sse_starlette.sse import EventSourceResponse
 from backend.log_core import LogManager
+import asyncio
+import logging
+import logging.handlers
 import os
+import queue
+
+# 日志经队列异步写出：热路径上的 logger 调用只入队，不阻塞在 stdout 上
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
 
 app = FastAPI(title="Tail-f Web Viewer")
 
-# 启用 GZip 压缩中间件（减少带宽占用 70-90%）
-app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """跳过 SSE 流的 GZip 中间件
+
+    压缩 event-stream 会把分块推送缓冲到压缩窗口填满，日志行因此延迟；
+    SSE 路由直接透传，其余路由照常压缩。
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/api/logs/stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# 启用 GZip 压缩中间件（减少带宽占用 70-90%；level 1 对日志文本压缩率
+# 与 level 6 接近，但吞吐高得多）
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1000, compresslevel=1)
 
 # 挂载静态文件目录
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -25,16 +50,49 @@ async def read_root():
 @app.get("/api/files")
 async def get_files():
     """获取日志文件列表（包括远程服务器）"""
-    files = await log_manager.get_file_list_async()
-    return JSONResponse(content=files)
+    # orjson 序列化好的字节直接返回，跳过默认 json.dumps
+    body = await log_manager.get_file_list_bytes()
+    return Response(content=body, media_type="application/json")
+
+async def _sse_with_heartbeat(source, interval: float = 15.0):
+    """转发 SSE 字节流，空闲超过 interval 秒时发送注释行保持连接"""
+    next_chunk = None
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(source.__anext__())
+            try:
+                chunk = await asyncio.wait_for(asyncio.shield(next_chunk), interval)
+            except asyncio.TimeoutError:
+                # SSE 注释帧，客户端忽略，仅用于保活
+                yield b":\n\n"
+                continue
+            except StopAsyncIteration:
+                break
+            next_chunk = None
+            yield chunk
+    finally:
+        # 先等挂起的 __anext__ 取消完成，再关闭源生成器，
+        # 否则 aclose 会撞上仍在运行的生成器
+        if next_chunk is not None:
+            next_chunk.cancel()
+            try:
+                await next_chunk
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+            except Exception:
+                pass
+        await source.aclose()
+
 
 @app.get("/api/logs/stream")
 async def stream_log(file: str = Query(..., description="Log file identifier")):
     """SSE 实时日志流接口"""
-    # 使用 sse-starlette 处理流式响应
-    return EventSourceResponse(
-        log_manager.tail_file(file, {}),
-        ping=2 # 心跳保持连接
+    # tail_file 直接产出 SSE 字节，绕过 sse-starlette 的逐消息封装
+    return StreamingResponse(
+        _sse_with_heartbeat(log_manager.tail_file(file, {})),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 @app.post("/api/logs/clear")
@@ -2,12 +2,31 @@
 安全验证模块
 提供路径验证、权限检查等安全机制
 """
+import functools
 import os
 import re
 from pathlib import Path
 from typing import List, Optional
 
 
+@functools.lru_cache(maxsize=16)
+def _resolve_whitelist(paths: tuple) -> tuple:
+    """解析白名单路径（白名单基本不变，按元组缓存解析结果）"""
+    return tuple(os.path.realpath(p) for p in paths)
+
+
+@functools.lru_cache(maxsize=4096)
+def validate_path_cached(path: str, allowed_paths: tuple) -> bool:
+    """validate_path 的缓存包装：同一路径反复校验时直接命中"""
+    return SecurityValidator.validate_path(path, allowed_paths)
+
+
+@functools.lru_cache(maxsize=4096)
+def validate_command_cached(command: str) -> bool:
+    """validate_command 的缓存包装"""
+    return SecurityValidator.validate_command(command)
+
+
 class SecurityValidator:
     """安全验证器"""
     
@@ -22,9 +41,18 @@ class SecurityValidator:
         r'/proc/',  # 系统进程信息
         r'/sys/',
     ]
+
+    # 合并为单个正则，一次扫描代替逐条 re.search
+    _DANGER_RE = re.compile('|'.join(DANGEROUS_PATTERNS), re.IGNORECASE)
     
     # 允许的命令白名单
     ALLOWED_COMMANDS = ['tail', 'cat', 'head', 'ls', 'find']
+
+    # 删除所有危险字符的转换表：translate 一次 C 级扫描即可判断是否包含
+    _DANGER_CHAR_TT = str.maketrans('', '', ';|&$`><\n\r')
+
+    # 文件名中除字母、数字、下划线、点、横线以外的字符
+    _FILENAME_UNSAFE_RE = re.compile(r'[^\w\.\-]')
     
     @staticmethod
     def validate_path(path: str, allowed_paths: List[str]) -> bool:
@@ -38,27 +66,27 @@ class SecurityValidator:
         Returns:
             bool: 路径是否安全
         """
-        # 规范化路径，防止路径穿越
+        # 解析符号链接并规范化，防止路径穿越和软链逃逸
         try:
-            normalized_path = os.path.normpath(path)
-            resolved_path = os.path.abspath(normalized_path)
+            resolved_path = os.path.realpath(path)
         except Exception:
             return False
-        
+
         # 检查危险模式
-        for pattern in SecurityValidator.DANGEROUS_PATTERNS:
-            if re.search(pattern, resolved_path, re.IGNORECASE):
-                return False
-        
+        if SecurityValidator._DANGER_RE.search(resolved_path):
+            return False
+
         # 检查是否在白名单内
         if not allowed_paths:
             return False
-            
-        for allowed in allowed_paths:
-            allowed_resolved = os.path.abspath(os.path.normpath(allowed))
-            if resolved_path.startswith(allowed_resolved):
+
+        # is_relative_to 按路径分量比较，分量不同立即短路，
+        # 也避免 /foo 误放行 /foobar
+        resolved = Path(resolved_path)
+        for allowed_resolved in _resolve_whitelist(tuple(allowed_paths)):
+            if resolved.is_relative_to(allowed_resolved):
                 return True
-        
+
         return False
     
     @staticmethod
@@ -79,12 +107,10 @@ class SecurityValidator:
         if cmd_name not in SecurityValidator.ALLOWED_COMMANDS:
             return False
         
-        # 检查是否包含危险字符
-        dangerous_chars = [';', '|', '&', '$', '`', '>', '<', '\n', '\r']
-        for char in dangerous_chars:
-            if char in command:
-                return False
-        
+        # 检查是否包含危险字符（translate 删掉危险字符后长度不变说明没有）
+        if len(command.translate(SecurityValidator._DANGER_CHAR_TT)) != len(command):
+            return False
+
         return True
     
     @staticmethod
@@ -99,7 +125,7 @@ class SecurityValidator:
             str: 清理后的文件名
         """
         # 只保留字母、数字、下划线、点、横线
-        return re.sub(r'[^\w\.\-]', '_', filename)
+        return SecurityValidator._FILENAME_UNSAFE_RE.sub('_', filename)
     
     @staticmethod
     def check_file_size(size: int, max_size: int = 104857600) -> bool:
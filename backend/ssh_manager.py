@@ -3,128 +3,188 @@ SSH 连接管理器
 负责管理远程服务器的 SSH 连接，提供连接池和安全控制
 """
 import asyncio
+import fnmatch
+import functools
+import logging
 import os
+import shlex
+import stat
 import time
 import re
 from typing import Dict, Optional, AsyncGenerator
 from pathlib import Path
-import paramiko
-from paramiko import SSHClient, AutoAddPolicy, RSAKey, Ed25519Key
-from backend.security import SecurityValidator
+import asyncssh
+from backend.security import SecurityValidator, validate_path_cached, validate_command_cached
+
+logger = logging.getLogger(__name__)
 
 # ANSI 颜色代码的正则表达式（支持带和不带 ESC 前缀的格式）
 ANSI_ESCAPE_PATTERN = re.compile(r'(\x1B\[[0-?]*[ -/]*[@-~]|\[[0-9;]+m)')
 
+# 字节版：tail 数据通路全程字节，避免在事件循环里逐行解码
+ANSI_ESCAPE_PATTERN_BYTES = re.compile(rb'(\x1B\[[0-?]*[ -/]*[@-~]|\[[0-9;]+m)')
+
 def strip_ansi_codes(text: str) -> str:
     """移除 ANSI 颜色代码"""
+    # 大部分日志行根本没有颜色代码，先用 C 级别的 in 判断跳过正则
+    if '\x1b' not in text and '[' not in text:
+        return text
     return ANSI_ESCAPE_PATTERN.sub('', text)
 
 
+def strip_ansi_codes_bytes(data: bytes) -> bytes:
+    """移除 ANSI 颜色代码（字节版）"""
+    if b'\x1b' not in data and b'[' not in data:
+        return data
+    return ANSI_ESCAPE_PATTERN_BYTES.sub(b'', data)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_pkey(path: str, mtime_ns: int) -> asyncssh.SSHKey:
+    """解析私钥并按 (路径, mtime) 缓存，重连时不再重复读盘和解码"""
+    return asyncssh.read_private_key(path)
+
+
+class ConnEntry:
+    """连接池条目（__slots__ 省掉每条目的实例字典，属性访问也更快）"""
+
+    __slots__ = ('client', 'last_used', 'config')
+
+    def __init__(self, client: asyncssh.SSHClientConnection, last_used: float, config: Dict):
+        self.client = client
+        self.last_used = last_used
+        self.config = config
+
+
 class SSHConnectionPool:
     """SSH 连接池"""
-    
+
     def __init__(self, max_connections: int = 10, timeout: int = 300):
         """
         初始化连接池
-        
+
         Args:
             max_connections: 最大连接数
             timeout: 连接超时时间（秒）
         """
         self.max_connections = max_connections
         self.timeout = timeout
-        self.connections: Dict[str, Dict] = {}  # {server_id: {client, last_used, config}}
+        self.connections: Dict[str, ConnEntry] = {}
+        # 锁只保护字典本身的读写；建连接在锁外进行
         self._lock = asyncio.Lock()
-    
-    async def get_connection(self, server_config: Dict) -> Optional[SSHClient]:
+        # 正在建立中的连接：并发请求同一服务器时共享同一个 future
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._refresher_task: Optional[asyncio.Task] = None
+
+        # known_hosts 只在建池时解析一次，重连风暴不再反复读盘；
+        # 文件缺失时退回不校验（与旧的 AutoAddPolicy 行为一致）
+        self._known_hosts = None
+        try:
+            self._known_hosts = asyncssh.read_known_hosts(
+                os.path.expanduser('~/.ssh/known_hosts'))
+        except (OSError, ValueError):
+            logger.warning("No usable ~/.ssh/known_hosts; remote host keys will not be verified")
+
+    async def get_connection(self, server_config: Dict) -> Optional[asyncssh.SSHClientConnection]:
         """
         获取或创建 SSH 连接
-        
+
         Args:
             server_config: 服务器配置
-            
+
         Returns:
-            SSHClient: SSH 客户端实例
+            SSHClientConnection: SSH 连接实例
         """
-        server_id = f"{server_config['host']}:{server_config.get('port', 22)}"
-        
+        # 按 (host, port, user) 共享连接：list/tail/clear 各自在同一条
+        # 传输上开独立通道，TCP 和加密握手只付一次
+        server_id = f"{server_config['host']}:{server_config.get('port', 22)}:{server_config.get('user', '')}"
+
+        # 惰性启动后台保活任务（构造时事件循环可能尚未运行）
+        if self._refresher_task is None:
+            self._refresher_task = asyncio.get_running_loop().create_task(self._refresher())
+
         async with self._lock:
             # 检查是否有现有连接
             if server_id in self.connections:
-                conn_info = self.connections[server_id]
-                client = conn_info['client']
-                
+                entry = self.connections[server_id]
+
                 # 检查连接是否仍然有效
-                try:
-                    transport = client.get_transport()
-                    if transport and transport.is_active():
-                        conn_info['last_used'] = time.time()
-                        return client
-                except Exception:
-                    pass
-                
-                # 连接已失效，关闭并移除
-                try:
-                    client.close()
-                except Exception:
-                    pass
+                if not entry.client.is_closed():
+                    entry.last_used = time.monotonic()
+                    return entry.client
+
+                # 连接已失效，移除
                 del self.connections[server_id]
-            
-            # 创建新连接
-            try:
-                client = await self._create_connection(server_config)
-                self.connections[server_id] = {
-                    'client': client,
-                    'last_used': time.time(),
-                    'config': server_config
-                }
-                return client
-            except Exception as e:
-                print(f"[SSH] Failed to connect to {server_id}: {e}")
-                return None
-    
-    async def _create_connection(self, config: Dict) -> SSHClient:
+
+            # 是否已有同一服务器的连接正在建立
+            waiter = self._pending.get(server_id)
+            if waiter is None:
+                self._pending[server_id] = asyncio.get_running_loop().create_future()
+
+        if waiter is not None:
+            # 等待建立中的连接，不重复握手（失败时结果为 None）
+            return await waiter
+
+        # 在锁外创建新连接：慢握手不会阻塞其他服务器的请求。
+        # pending 的弹出和了结放在 finally 里：本任务在握手途中被取消
+        # （浏览器断开 SSE 就会发生）时也必须兑现 future，否则后续
+        # 请求会永远挂在这个孤儿 future 上
+        client = None
+        try:
+            client = await self._create_connection(server_config)
+        except Exception as e:
+            logger.warning("Failed to connect to %s: %s", server_id, e)
+        finally:
+            async with self._lock:
+                pending = self._pending.pop(server_id, None)
+                if client is not None:
+                    self.connections[server_id] = ConnEntry(client, time.monotonic(), server_config)
+            if pending is not None and not pending.done():
+                pending.set_result(client)
+        return client
+
+    async def _create_connection(self, config: Dict) -> asyncssh.SSHClientConnection:
         """
         创建新的 SSH 连接
-        
+
         Args:
             config: 服务器配置
-            
+
         Returns:
-            SSHClient: SSH 客户端实例
+            SSHClientConnection: SSH 连接实例
         """
-        client = SSHClient()
-        
-        # 安全策略：只接受已知主机（生产环境应使用 known_hosts）
-        # 这里为了演示使用 AutoAddPolicy，实际部署时应该更严格
-        client.set_missing_host_key_policy(AutoAddPolicy())
-        
         host = config['host']
         port = config.get('port', 22)
         user = config['user']
         auth_method = config.get('auth_method', 'key')
-        
+
         connect_kwargs = {
-            'hostname': host,
+            'host': host,
             'port': port,
             'username': user,
-            'timeout': 10,
-            'banner_timeout': 10,
-            'auth_timeout': 10,
+            # 安全策略：使用预加载的 known_hosts 校验主机密钥；
+            # 没有 known_hosts 文件时为 None（跳过校验，部署时应配齐）
+            'known_hosts': self._known_hosts,
+            'connect_timeout': 10,
+            'login_timeout': 10,
+            # 协议级心跳：防止中间设备悄悄掐掉空闲连接
+            'keepalive_interval': 30,
         }
-        
+
         # 根据认证方式连接
         if auth_method == 'key':
+            # 一次 stat 同时拿到存在性、权限位和密钥缓存所需的 mtime
             key_path = config.get('key_path')
-            if not key_path or not os.path.exists(key_path):
+            try:
+                key_stat = os.stat(key_path)
+            except (OSError, TypeError):
                 raise ValueError(f"SSH key not found: {key_path}")
-            
+
             # 验证密钥文件权限（应该是 600）
-            key_stat = os.stat(key_path)
             if key_stat.st_mode & 0o077:
-                print(f"[SSH] Warning: Key file {key_path} has insecure permissions")
-            
-            connect_kwargs['key_filename'] = key_path
+                logger.warning("Key file %s has insecure permissions", key_path)
+
+            connect_kwargs['client_keys'] = [_load_pkey(key_path, key_stat.st_mtime_ns)]
         elif auth_method == 'password':
             password = config.get('password')
             if not password:
@@ -132,242 +192,304 @@ class SSHConnectionPool:
             connect_kwargs['password'] = password
         else:
             raise ValueError(f"Unsupported auth method: {auth_method}")
-        
-        # 在线程池中执行阻塞的 SSH 连接
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, lambda: client.connect(**connect_kwargs))
-        
-        return client
-    
+
+        # asyncssh 的连接本身就是协程，无需线程池
+        return await asyncssh.connect(**connect_kwargs)
+
+    async def _refresher(self):
+        """后台保活：发现断开的连接就提前重建，前台请求不再付握手延迟"""
+        while True:
+            await asyncio.sleep(30)
+            async with self._lock:
+                entries = list(self.connections.items())
+            for server_id, entry in entries:
+                if not entry.client.is_closed():
+                    continue
+                try:
+                    new_client = await self._create_connection(entry.config)
+                except Exception as e:
+                    logger.warning("Background reconnect to %s failed: %s", server_id, e)
+                    async with self._lock:
+                        if self.connections.get(server_id) is entry:
+                            self.connections.pop(server_id)
+                    continue
+
+                # 建连接期间前台可能已经删掉该条目并自建了连接；
+                # 只有条目仍在池里时才接管，否则关掉多余的连接防止泄漏
+                async with self._lock:
+                    still_current = self.connections.get(server_id) is entry
+                    if still_current:
+                        entry.client = new_client
+                if still_current:
+                    logger.info("Reconnected to %s in background", server_id)
+                else:
+                    new_client.close()
+
     async def cleanup_idle_connections(self):
         """清理空闲连接"""
         async with self._lock:
-            current_time = time.time()
+            current_time = time.monotonic()
             to_remove = []
-            
-            for server_id, conn_info in self.connections.items():
-                if current_time - conn_info['last_used'] > self.timeout:
+
+            for server_id, entry in self.connections.items():
+                if current_time - entry.last_used > self.timeout:
                     to_remove.append(server_id)
-            
+
             for server_id in to_remove:
-                try:
-                    self.connections[server_id]['client'].close()
-                except Exception:
-                    pass
+                self.connections[server_id].client.close()
                 del self.connections[server_id]
-                print(f"[SSH] Closed idle connection to {server_id}")
-    
+                logger.info("Closed idle connection to %s", server_id)
+
     async def close_all(self):
         """关闭所有连接"""
+        if self._refresher_task is not None:
+            self._refresher_task.cancel()
+            self._refresher_task = None
         async with self._lock:
-            for conn_info in self.connections.values():
-                try:
-                    conn_info['client'].close()
-                except Exception:
-                    pass
+            for entry in self.connections.values():
+                entry.client.close()
             self.connections.clear()
 
 
 class RemoteFileReader:
     """远程文件读取器"""
-    
+
+    # 远程命令模板（路径和模式统一经 shlex.quote 后再绑定，
+    # 特殊字符不会被远端 shell 解释）
+    _FIND_PRINTF = r"%p\t%s\t%T@\n"
+    _CMD_FIND_RECURSIVE = "find {d} -type f -name {p} -printf '" + _FIND_PRINTF + "'"
+    _TAIL_SENTINEL = "---TAILF-LIVE---"
+    _CMD_TAIL = (
+        "stat -c %s {p} 2>/dev/null || echo 0; "
+        "tail -c 10240 {p} 2>/dev/null; "
+        "echo; echo " + _TAIL_SENTINEL + "; "
+        "exec tail -c 0 -f {p}"
+    )
+    _CMD_CLEAR = "truncate -s 0 {p}"
+
     def __init__(self, ssh_pool: SSHConnectionPool):
         """
         初始化远程文件读取器
-        
+
         Args:
             ssh_pool: SSH 连接池
         """
         self.ssh_pool = ssh_pool
         self.validator = SecurityValidator()
-    
-    async def list_files(self, server_config: Dict, directory: str, pattern: str = "*", 
+
+    async def list_files(self, server_config: Dict, directory: str, pattern: str = "*",
                         recursive: bool = False) -> list:
         """
         列出远程目录中的文件
-        
+
         Args:
             server_config: 服务器配置
             directory: 目录路径
             pattern: 文件匹配模式
             recursive: 是否递归扫描
-            
+
         Returns:
             list: 文件列表
         """
-        # 安全验证
-        allowed_paths = server_config.get('allowed_paths', [])
-        if not self.validator.validate_path(directory, allowed_paths):
-            print(f"[Security] Path rejected: {directory}")
+        # 安全验证（白名单转成元组以命中验证缓存）
+        allowed_paths = tuple(server_config.get('allowed_paths', []))
+        if not validate_path_cached(directory, allowed_paths):
+            logger.warning("Path rejected: %s", directory)
             return []
-        
+
         client = await self.ssh_pool.get_connection(server_config)
         if not client:
             return []
-        
+
+        max_files = 1000  # 限制最多返回 1000 个文件
+
         try:
-            # 构建安全的 find 命令（不使用管道或重定向）
-            # 使用绝对路径并加上引号，避免空格等问题
-            if recursive:
-                cmd = f"find '{directory}' -type f -name '{pattern}'"
-            else:
-                cmd = f"find '{directory}' -maxdepth 1 -type f -name '{pattern}'"
+            if not recursive:
+                # 非递归列目录走 SFTP：readdir 在协议帧里直接带回 stat
+                # 信息，远端不用起 shell
+                async with client.start_sftp_client() as sftp:
+                    entries = await sftp.readdir(directory)
+
+                files = []
+                for entry in entries:
+                    name = entry.filename
+                    if name in ('.', '..') or not fnmatch.fnmatch(name, pattern):
+                        continue
+                    permissions = entry.attrs.permissions or 0
+                    if not stat.S_ISREG(permissions):
+                        continue
+                    files.append({
+                        "path": os.path.join(directory, name),
+                        "name": name,
+                        "size": entry.attrs.size or 0,
+                        "mtime": float(entry.attrs.mtime or 0),
+                    })
+                    if len(files) >= max_files:
+                        break
+                return files
+
+            # 递归扫描仍用一条 find：SFTP 逐层 readdir 要付目录数个往返
+            # -printf 让一条命令同时带回路径、大小和修改时间，
+            # 免去调用方再逐个 stat
+            cmd = self._CMD_FIND_RECURSIVE.format(d=shlex.quote(directory), p=shlex.quote(pattern))
 
             # 验证命令安全性（整个命令字符串中不能包含危险字符）
-            if not self.validator.validate_command(cmd):
-                print(f"[Security] Command rejected: {cmd}")
+            if not validate_command_cached(cmd):
+                logger.warning("Command rejected: %s", cmd)
                 return []
 
-            # 执行命令
-            loop = asyncio.get_event_loop()
-            stdin, stdout, stderr = await loop.run_in_executor(
-                None, client.exec_command, cmd
-            )
+            # 执行命令（原生协程，无需线程池）
+            result = await client.run(cmd, check=False)
 
             files = []
-            line_count = 0
-            max_files = 1000  # 限制最多返回 1000 个文件
-
-            for line in stdout:
-                if line_count >= max_files:
+            for line in (result.stdout or '').splitlines():
+                if len(files) >= max_files:
                     break
-                file_path = line.strip()
-                if file_path:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    file_path, size, mtime = line.split('\t')
                     files.append({
                         "path": file_path,
-                        "name": os.path.basename(file_path)
+                        "name": os.path.basename(file_path),
+                        "size": int(size),
+                        "mtime": float(mtime),
                     })
-                    line_count += 1
+                except ValueError:
+                    # 行格式异常（如文件名含制表符），跳过
+                    continue
 
             return files
         except Exception as e:
-            print(f"[SSH] Error listing files: {e}")
+            logger.warning("Error listing files: %s", e, exc_info=True)
             return []
-    
-    async def tail_file(self, server_config: Dict, file_path: str, 
+
+    async def tail_file(self, server_config: Dict, file_path: str,
                        encoding: str = "utf-8") -> AsyncGenerator[Dict[str, str], None]:
         """
         实时读取远程文件（tail -f）
-        
+
         Args:
             server_config: 服务器配置
             file_path: 文件路径
             encoding: 文件编码
-            
+
         Yields:
             Dict: 日志行数据
         """
-        # 安全验证
-        allowed_paths = server_config.get('allowed_paths', [])
-        if not self.validator.validate_path(file_path, allowed_paths):
+        # 安全验证（白名单转成元组以命中验证缓存）
+        allowed_paths = tuple(server_config.get('allowed_paths', []))
+        if not validate_path_cached(file_path, allowed_paths):
             yield {"data": f"[SECURITY] Access denied: {file_path}"}
             return
-        
+
         client = await self.ssh_pool.get_connection(server_config)
         if not client:
             yield {"data": "[ERROR] Failed to connect to remote server"}
             return
-        
+
         try:
-            # 先读取文件最后 10KB 的历史内容
             max_size = server_config.get('max_file_size', 104857600)
-            cmd_check = f"stat -c %s {file_path} 2>/dev/null || echo 0"
-            
-            loop = asyncio.get_event_loop()
-            stdin, stdout, stderr = await loop.run_in_executor(
-                None, client.exec_command, cmd_check
-            )
-            file_size = int(stdout.read().decode().strip() or 0)
-            
-            if not self.validator.check_file_size(file_size, max_size):
-                yield {"data": f"[ERROR] File too large: {file_size} bytes (max: {max_size})"}
-                return
-            
-            # 读取历史日志（最后 10KB）
-            if file_size > 0:
-                read_size = min(file_size, 10240)
-                cmd_history = f"tail -c {read_size} {file_path}"
-                
-                stdin, stdout, stderr = await loop.run_in_executor(
-                    None, client.exec_command, cmd_history
-                )
-                
-                for line in stdout:
-                    decoded_line = line.strip()
-                    if decoded_line:
-                        # 移除 ANSI 颜色代码
-                        clean_line = strip_ansi_codes(decoded_line)
-                        yield {"data": clean_line}
-            
-            # 开始实时 tail
-            cmd_tail = f"tail -f {file_path}"
-            
-            if not self.validator.validate_command(cmd_tail):
-                yield {"data": f"[SECURITY] Command rejected: {cmd_tail}"}
-                return
-            
-            stdin, stdout, stderr = await loop.run_in_executor(
-                None, client.exec_command, cmd_tail
-            )
-            
-            # 持续读取新行
-            while True:
+
+            # 把 stat、历史读取和实时 tail 合并成一次 exec，启动只付一个往返
+            sentinel = self._TAIL_SENTINEL.encode()
+            cmd = self._CMD_TAIL.format(p=shlex.quote(file_path))
+
+            # UTF-8 内容原样透传；其他编码在产出时转一次 UTF-8
+            needs_transcode = encoding.lower() not in ('utf-8', 'utf8', 'ascii')
+
+            # 每个 tail 在共享连接上打开自己的会话通道。
+            # encoding=None 让通道直接产出字节，解码推迟到必要时；
+            # stderr 并入 stdout，一个读取循环即可，远端错误也随流可见
+            async with client.create_process(cmd, encoding=None,
+                                             stderr=asyncssh.STDOUT) as process:
+                # 第一行是文件大小；超限时直接返回，退出时顺带杀掉远端进程
+                size_line = await process.stdout.readline()
                 try:
-                    # 在线程池中读取一行
-                    line = await loop.run_in_executor(None, stdout.readline)
-                    if line:
-                        decoded_line = line.strip()
-                        if decoded_line:
+                    file_size = int(size_line.strip() or 0)
+                except ValueError:
+                    file_size = 0
+
+                if not self.validator.check_file_size(file_size, max_size):
+                    yield {"data": f"[ERROR] File too large: {file_size} bytes (max: {max_size})"}
+                    return
+
+                # 哨兵行之前是历史内容，之后是实时输出。
+                # 按 64KB 大块读取、本地拆行，不足一行的残尾留到下一块；
+                # 同一块里的行合并推送，免得每行付一次调度和下游帧开销
+                batch_lines = server_config.get('batch_lines', 64)
+                in_history = True
+                # 残尾缓冲复用同一个 bytearray，+= 原地扩展而不是
+                # 每块都新建 bytes 对象
+                residual = bytearray()
+                batch = []
+                while True:
+                    data = await process.stdout.read(65536)
+                    if not data:
+                        break
+                    residual += data
+                    if b'\n' not in residual:
+                        continue
+                    lines = residual.split(b'\n')
+                    tail_part = lines.pop()
+                    del residual[:]
+                    residual += tail_part
+                    for line in lines:
+                        line = line.strip()
+                        if in_history and line == sentinel:
+                            in_history = False
+                            continue
+                        if line:
                             # 移除 ANSI 颜色代码
-                            clean_line = strip_ansi_codes(decoded_line)
-                            yield {"data": clean_line}
-                    else:
-                        await asyncio.sleep(0.1)
-                except Exception as e:
-                    print(f"[SSH] Error reading line: {e}")
-                    break
-                    
+                            clean_line = strip_ansi_codes_bytes(line)
+                            if needs_transcode:
+                                clean_line = clean_line.decode(encoding, 'replace').encode()
+                            batch.append(clean_line)
+                            if len(batch) >= batch_lines:
+                                yield {"data": b"\n".join(batch)}
+                                batch.clear()
+                    if batch:
+                        yield {"data": b"\n".join(batch)}
+                        batch.clear()
+
         except Exception as e:
             yield {"data": f"[ERROR] Failed to read remote file: {str(e)}"}
-    
+
     async def clear_file(self, server_config: Dict, file_path: str) -> bool:
         """
         清空远程文件
-        
+
         Args:
             server_config: 服务器配置
             file_path: 文件路径
-            
+
         Returns:
             bool: 是否成功
         """
-        # 安全验证
-        allowed_paths = server_config.get('allowed_paths', [])
-        if not self.validator.validate_path(file_path, allowed_paths):
-            print(f"[Security] Clear file rejected: {file_path}")
+        # 安全验证（白名单转成元组以命中验证缓存）
+        allowed_paths = tuple(server_config.get('allowed_paths', []))
+        if not validate_path_cached(file_path, allowed_paths):
+            logger.warning("Clear file rejected: %s", file_path)
             return False
-        
+
         client = await self.ssh_pool.get_connection(server_config)
         if not client:
             return False
-        
+
         try:
             # 使用 truncate 命令清空文件（比 > 更安全）
-            cmd = f"truncate -s 0 {file_path}"
-            
-            loop = asyncio.get_event_loop()
-            stdin, stdout, stderr = await loop.run_in_executor(
-                None, client.exec_command, cmd
-            )
-            
+            cmd = self._CMD_CLEAR.format(p=shlex.quote(file_path))
+
+            result = await client.run(cmd, check=False)
+
             # 检查是否有错误
-            error_output = stderr.read().decode().strip()
+            error_output = (result.stderr or '').strip()
             if error_output:
-                print(f"[SSH] Error clearing file: {error_output}")
+                logger.warning("Error clearing file: %s", error_output)
                 return False
-            
+
             return True
         except Exception as e:
-            print(f"[SSH] Error clearing file: {e}")
+            logger.warning("Error clearing file: %s", e, exc_info=True)
             return False
-